@@ -6,20 +6,100 @@ This script is for scraping metadata from the TU Wien repository.
 """
 
 import requests
-from bs4 import BeautifulSoup
-from bs4.element import Tag
-from io import BytesIO
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession, DO_NOT_CACHE
+from selectolax.lexbor import LexborHTMLParser as HTMLParser, LexborNode as Node
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator
+import pypdfium2 as pdfium
 from PyPDF2 import PdfReader
+from PyPDF2.errors import PyPdfError
+from concurrent.futures import ThreadPoolExecutor
+import re
+import threading
 import time
-import json
+import warnings
+from urllib.robotparser import RobotFileParser
+import orjson
+import os
 # import pandas as pd
 
 # Define constants
 DOMAIN = "https://repositum.tuwien.at"
 MAIN_PAGE = "https://repositum.tuwien.at/simple-search?location=theses&query=&crisID=&relationName=&filter_field_1=dateIssued&filter_type_1=equals&filter_value_1=%5B2020+TO+2024%5D&rpp=50&sort_by=bi_sort_2_sort&order=desc&submit_search=Update"
-CRAWL_DELAY = 5  # 5 seconds as requested by https://repositum.tuwien.at/robots.txt
+USER_AGENT = "RepositumScraper/0.1 (+https://github.com/Emile-Jn/repositum-scraper)"
+TIMEOUT = 30  # seconds
+PDF_CHUNK_SIZE = 64 * 1024  # bytes read at a time when downloading a PDF
+PDF_MAX_MEMORY = 4 * 1024 * 1024  # PDFs larger than this are spooled to a temporary file on disk
+CACHE_EXPIRY = 7 * 86400  # pages are cached for a week, in seconds
+MAX_WORKERS = 4  # publications scraped concurrently (requests are still sent one per CRAWL_DELAY)
+BATCH_SIZE = 64  # ids handed to the workers at a time by collect_metadata()
 
-INTERESTING_INFO = [
+# One session for all requests, so the connection to the repository is kept alive and reused.
+# HTML pages are cached on disk so that repeated or interrupted runs don't request them again,
+# PDFs are not cached because they are large and only read once.
+# The session is shared by the worker threads of collect_metadata(): the urllib3 connection pool and
+# the cookie jar are guarded by locks, and requests-cache's SQLite backend locks its own connections.
+SESSION = CachedSession('repositum_cache',
+                        backend='sqlite',
+                        expire_after=CACHE_EXPIRY,
+                        urls_expire_after={'repositum.tuwien.at/bitstream/*': DO_NOT_CACHE})
+# Everything goes to one host and requests are sent one at a time, so a single pool with at most
+# one connection per worker thread (e.g. while a PDF is still downloading) is enough.
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+SESSION.headers['User-Agent'] = USER_AGENT
+
+# Follow the rules of https://repositum.tuwien.at/robots.txt as they are when the script starts.
+# It is downloaded with the session (not cached) so that the request has a timeout and our User-Agent.
+ROBOTS = RobotFileParser(DOMAIN + '/robots.txt')
+try:
+    robots_response = SESSION.get(ROBOTS.url, timeout=TIMEOUT, expire_after=DO_NOT_CACHE)
+except requests.RequestException:
+    robots_response = None
+if robots_response is None or robots_response.status_code >= 500:
+    # robots.txt is unreachable, so everything is disallowed (RFC 9309) and every fetch() will fail
+    ROBOTS.disallow_all = True
+    warnings.warn(f'{ROBOTS.url} could not be downloaded, all requests to {DOMAIN} are disallowed')
+elif robots_response.status_code in (401, 403):
+    ROBOTS.disallow_all = True  # same as RobotFileParser.read()
+elif robots_response.ok:
+    ROBOTS.parse(robots_response.text.splitlines())
+else:  # any other 4xx means there is no robots.txt, so nothing is disallowed
+    ROBOTS.allow_all = True
+CRAWL_DELAY = ROBOTS.crawl_delay(USER_AGENT) or 5  # 5 seconds was requested at the time of writing
+
+_last_request_time = time.monotonic()  # time of the last request sent to the repository (robots.txt so far)
+_request_lock = threading.Lock()  # shared by all threads so that only one of them waits for the next request slot
+_pdfium_lock = threading.Lock()  # PDFium is not thread-safe, so only one thread may use pypdfium2 at a time
+
+# CSS selectors used on the publication pages
+WRAPPER_SEL = 'div#wrapperDisplayItem'
+ROW_SEL = 'div.row.metadata-row'
+LABEL_SEL = 'div.metadataFieldLabel'
+VALUE_SEL = 'div.metadataFieldValue'
+PDF_LINK_SEL = 'div.item-bitstream-grid-bitstream-type a[href]'
+
+# Translation table that deletes all whitespace characters, used to clean up text from PDFs
+WHITESPACE_DELETION = str.maketrans('', '', ' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0\u1680'
+                                            '\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a'
+                                            '\u2028\u2029\u202f\u205f\u3000')
+
+# Patterns for the degree on the first page of a thesis, applied to the text without whitespaces.
+# The degree is the text between the text which directly precedes it and the text which directly follows it.
+DEGREE_EN = re.compile(r'degreeof(.+?)by')
+DEGREE_DE = re.compile(r'desStudiums(.+?)eingereichtvon')
+
+# Beginnings of the error messages of scrape_publication_page() caused by network problems or an overloaded
+# server, these ids are retried on the next run. All other errors come from the page itself and are final.
+TEMPORARY_ERRORS = (
+    'Request failed:',
+    'PDF download failed:',
+    'Negative response: 429',
+    'Negative response: 5'
+)
+
+INTERESTING_INFO = frozenset([
     'dc.contributor.advisor',
     'dc.contributor.author',
     'dc.date.accessioned',
@@ -40,38 +120,56 @@ INTERESTING_INFO = [
     'item.openaccessfulltext',
     'crisitem.author.dept',
     'crisitem.author.parentorg'
-]
+])
 
-def next_results_page(soup: BeautifulSoup) -> str or None:
+def fetch(url: str, stream: bool = False) -> requests.Response:
+    """
+    Send a GET request to the repository, waiting only as long as needed to respect the crawl delay
+    :param url: the URL to request
+    :param stream: if True, the body is not downloaded until it is read from the response
+    :return: the response
+    """
+    global _last_request_time
+    if not ROBOTS.can_fetch(USER_AGENT, url):
+        raise PermissionError(f'{url} is disallowed by {DOMAIN}/robots.txt')
+    if not stream:
+        # cached pages don't reach the server, so they don't have to wait for the crawl delay
+        response = SESSION.get(url, timeout=TIMEOUT, only_if_cached=True)
+        if response.status_code != 504:  # 504 means the page is not in the cache
+            return response
+    with _request_lock:
+        # time spent parsing since the last request counts towards the crawl delay
+        wait = _last_request_time + CRAWL_DELAY - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_request_time = time.monotonic()
+    return SESSION.get(url, timeout=TIMEOUT, stream=stream)
+
+def next_results_page(tree: HTMLParser) -> str or None:
     """
     Get the link to the next page of search results
-    :param soup: created from a search page in /simple-search
+    :param tree: created from a search page in /simple-search
     :return: the URL to the next page of search results or None if there is no next page
     """
-    # Find the pagination list
-    pagination_list = soup.find('ul', class_='pagination pull-right')
-    if not pagination_list:
-        return None
-    # Find the link called "Next"
-    next_link = pagination_list.find('a', string="Next")
-    if next_link:
-        return next_link['href']
-    else:
-        return None
+    # Find the link called "Next" in the pagination list
+    for a in tree.css('ul.pagination.pull-right a[href]'):
+        if a.text().strip() == "Next":
+            return a.attributes['href']
+    return None
 
-def get_theses_links(soup: BeautifulSoup) -> list[str]:
+def get_theses_links(tree: HTMLParser) -> list[str]:
     """
     On a search page, get all the links to the theses
-    :param soup: created from a search results page in /simple-search
+    :param tree: created from a search results page in /simple-search
     :return:
     """
-    theses_table = soup.find('table', class_='table table-hover')
+    theses_table = tree.css_first('table.table.table-hover')
     # find all links in theses_table that start with /handle/
     links = []
     if theses_table:
-        for a in theses_table.find_all('a', href=True):
-            if a['href'].startswith('/handle/'):
-                links.append(a['href'])
+        for a in theses_table.css('a[href]'):
+            if a.attributes['href'].startswith('/handle/'):
+                links.append(a.attributes['href'])
     return links
 
 def get_all_theses_links(start_page: str) -> list[str]:
@@ -81,15 +179,14 @@ def get_all_theses_links(start_page: str) -> list[str]:
     :return: a list of URLs to the theses
     """
     all_links = []
-    current_page = requests.get(start_page)
+    current_page = fetch(start_page)
     while True:
-        soup = BeautifulSoup(current_page.content, 'html.parser')
-        all_links.extend(get_theses_links(soup))
+        tree = HTMLParser(current_page.content)
+        all_links.extend(get_theses_links(tree))
         print(f'\r{len(all_links)} thesis links found', end='')
-        next_page = next_results_page(soup)
+        next_page = next_results_page(tree)
         if next_page:
-            time.sleep(CRAWL_DELAY)  # wait 1 second to avoid overload
-            current_page = requests.get(next_page)
+            current_page = fetch(next_page)
         else:
             break
     return all_links
@@ -100,9 +197,7 @@ def save_links(links: list[str]):
     :param links: list of URLs
     :return:
     """
-    with open('thesis_links.txt', 'w') as f:
-        for link in links:
-            f.write(link + '\n')
+    Path('thesis_links.txt').write_text(''.join(link + '\n' for link in links), encoding='utf-8')
 
 def get_thesis_info(link: str) -> dict:
     """
@@ -110,56 +205,75 @@ def get_thesis_info(link: str) -> dict:
     :param link: URL of the thesis page
     :return: dictionary of properties
     """
-    info_dict = {}
-    thesis_page = requests.get(DOMAIN + link)
-    soup = BeautifulSoup(thesis_page.content, 'html.parser')
-    button = soup.find('a', class_ = 'btn btn-primary')
-    print(f'button string: {button.text}')
-    if not button:
+    # the full item record is the thesis page in full mode, so the landing page can be skipped
+    full_record = fetch(DOMAIN + link + '?mode=full')
+    tree = HTMLParser(full_record.content)
+    wrapper_display = tree.css_first(WRAPPER_SEL)
+    if not wrapper_display:
         raise ValueError("No full item record found")
-    full_record = requests.get(DOMAIN + button['href'])
-    soup = BeautifulSoup(full_record.content, 'html.parser')
 
     # Get the (interesting) rows from the page
-    table = soup.find('div', id='wrapperDisplayItem')
-    rows = table.find_all('div', class_="row metadata-row")
-    for row in rows:
-        if row.find('div', class_="col-md-3 col-sm-4 metadataFieldLabel"):
-            info = row.find('div', class_="col-md-3 col-sm-4 metadataFieldLabel").text.strip()
-            data = row.find('div', class_="col-md-8 col-sm-8 metadataFieldValue").text.strip()
-            if info in INTERESTING_INFO:
-                if info in info_dict.keys():
-                    info_dict[info] = info_dict[info] + ', ' + data
-                else:
-                    info_dict[info] = data
-
-    return info_dict
+    rows = wrapper_display.css(ROW_SEL)
+    return get_resource_attributes(rows, INTERESTING_INFO)
 
-def get_thesis_pdf(link: str) -> bytes:
+def get_thesis_pdf(link: str) -> BinaryIO:
     """
     Find the link to the PDF of the thesis and download it
     :param link: URL of the thesis page
-    :return:
+    :return: the pdf file, in memory or spooled to disk if it is large
+    """
+    thesis_page = fetch(DOMAIN + link + '?mode=full')  # same page as in get_thesis_info(), so it is cached
+    pdf_link = HTMLParser(thesis_page.content).css_first(PDF_LINK_SEL).attributes['href']
+    return download_pdf(pdf_link)
+
+def download_pdf(pdf_link: str) -> BinaryIO:
+    """
+    Download a PDF from the repository
+    :param pdf_link: path of the PDF, e.g. the 'PDF link' from scrape_publication_page()
+    :return: the pdf file, in memory or spooled to disk if it is large
     """
-    thesis_page = requests.get(DOMAIN + link)
-    soup = BeautifulSoup(thesis_page.content, 'html.parser')
-    link_div = soup.find('div', class_='item-bitstream-grid-bitstream-type')
-    pdf_link = link_div.find('a')['href']
-    pdf = requests.get(DOMAIN + pdf_link).content
+    pdf = SpooledTemporaryFile(max_size=PDF_MAX_MEMORY)
+    # stream the download so that large PDFs are never held in memory as a whole
+    with fetch(DOMAIN + pdf_link, stream=True) as response:
+        response.raise_for_status()
+        # e.g. a login page instead of the file of an embargoed thesis
+        if response.headers.get('Content-Type', '').startswith('text/html'):
+            raise ValueError(f'{pdf_link} is an HTML page, not a PDF')
+        for chunk in response.iter_content(chunk_size=PDF_CHUNK_SIZE):
+            pdf.write(chunk)
+    pdf.seek(0)
     return pdf
 
-def parse_pdf(pdf: bytes) -> str:
+def parse_pdf(pdf: BinaryIO) -> str:
     """
     Extract text from the first page of a PDF
-    :param pdf: the pdf file in bytes
+    :param pdf: the pdf file, as returned by get_thesis_pdf()
     :return: all text on the first page
     """
-    if pdf:
-        reader = PdfReader(BytesIO(pdf))
-        first_page = reader.pages[0].extract_text()
-        return first_page
-    else:
+    # a file object is always truthy, so check its size to detect an empty download
+    if pdf.seek(0, os.SEEK_END) == 0:
         return ""
+    pdf.seek(0)
+    with _pdfium_lock:
+        try:
+            document = pdfium.PdfDocument(pdf)
+        except pdfium.PdfiumError:
+            document = None
+        else:
+            try:
+                page = document[0]
+                text_page = page.get_textpage()
+                first_page = text_page.get_text_range()
+                text_page.close()
+                page.close()
+            finally:
+                document.close()
+    if document is None:
+        # fall back to the (much slower) pure Python reader for files PDFium cannot open
+        pdf.seek(0)
+        reader = PdfReader(pdf)
+        return reader.pages[0].extract_text()
+    return first_page
 
 def get_degree(raw_text: str) -> str or None:
     """
@@ -167,25 +281,11 @@ def get_degree(raw_text: str) -> str or None:
     :param raw_text: the text on the first page of the thesis PDF
     :return: name of the degree (without whitespaces) or None if not found
     """
-    opening_text_en = "degreeof"  # the text (without spaces) which directly precedes the degree
-    closing_text_en = "by"  # the text (without spaces) which directly follows the degree
-    opening_text_de = "desStudiums"  # the text (without spaces) which directly precedes the degree
-    closing_text_de = "eingereichtvon"  # the text (without spaces) which directly follows the degree
     # remove all whitespaces from the text (because of faulty pdf decoding which adds whitespaces)
-    text = ''.join(raw_text.split())
-    # English
-    if opening_text_en in text:
-        start = text.find(opening_text_en) + len(opening_text_en)
-        end = text.find(closing_text_en)
-        degree = text[start:end]
-    # Deutsch
-    elif opening_text_de in text:
-        start = text.find(opening_text_de) + len(opening_text_de)
-        end = text.find(closing_text_de)
-        degree = text[start:end]
-    else:
-        degree = None
-    return degree
+    text = raw_text.translate(WHITESPACE_DELETION)
+    # English first, then Deutsch
+    match = DEGREE_EN.search(text) or DEGREE_DE.search(text)
+    return match.group(1) if match else None
 
 def scrape_publication_page(id: int,
                             path: str = '/handle',
@@ -204,32 +304,35 @@ def scrape_publication_page(id: int,
     if id >= 300_000:
         raise ValueError('id must be less than 300_000')
     link = DOMAIN + path + doi_prefix + str(id) + '?mode=full'
-    time.sleep(CRAWL_DELAY)  # to be sure to respect the robots.txt
-    page = requests.get(link)
+    try:
+        page = fetch(link)
+    except requests.RequestException as error:  # e.g. timeout or connection error, retried on the next run
+        return f'Request failed: {error!r}'
     if page.status_code != 200:
         return f'Negative response: {page.status_code}'
 
-    soup = BeautifulSoup(page.content, 'html.parser')
+    tree = HTMLParser(page.content)
 
     # Check if the identifier exists
-    if soup.find(lambda tag: tag.name=='h1' and tag.get_text().strip == 'Invalid Identifier'):
+    h1 = tree.css_first('h1')
+    if h1 and h1.text().strip() == 'Invalid Identifier':
         return 'Invalid Identifier'
 
     # Find table with metadata
-    wrapper_display = soup.find('div', id='wrapperDisplayItem')
+    wrapper_display = tree.css_first(WRAPPER_SEL)
     if not wrapper_display:
         return 'No wrapperDisplayItem found'
-    table = wrapper_display.find('div', class_='row')
+    table = wrapper_display.css_first('div.row')
     if not table:
         return 'No row class found'
-    rows = table.find_all('div', class_='row metadata-row')
+    rows = table.css(ROW_SEL)
     if not rows:
         return 'No metadata rows found'
     else:
         attributes =  get_resource_attributes(rows)
 
     # Find metrics
-    views, downloads = get_metrics(soup)
+    views, downloads = get_metrics(tree)
     attributes['Views'] = views
     attributes['Downloads'] = downloads
 
@@ -238,71 +341,167 @@ def scrape_publication_page(id: int,
 
     return attributes
 
-def get_resource_attributes(rows: list) -> dict:
+def metadata_pairs(rows: list[Node]) -> Iterator[tuple[str, str]]:
     """
-    Extract all metadata from the rows of a publication page
-    :param rows: list of bs4 Tag objects obtained in scrape_publication_page()
-    :return: dictionary of metadata
+    Iterate through the rows of a publication page and yield their label and value
+    :param rows: list of selectolax Node objects obtained in scrape_publication_page()
+    :return: (label, value) for every row which has both
     """
-    attributes = {}
     for row in rows:
-        label = row.find('div', class_='col-md-3 col-sm-4 metadataFieldLabel')
-        value = row.find('div', class_='col-md-8 col-sm-8 metadataFieldValue')
+        label = row.css_first(LABEL_SEL)
+        value = row.css_first(VALUE_SEL)
         # add language field here if desired, but it's usually not very informative
         if label and value:
             # Sometimes random whitespaces are added to the text, so we strip it
-            label = label.text.strip()
-            value = value.text.strip()
-            if label in attributes.keys():  # check if the label is already in the dictionary
-                attributes[label] = attributes[label] + ', ' + value  # extend the list
-            else:
-                attributes[label] = value
+            yield label.text().strip(), value.text().strip()
+
+def get_resource_attributes(rows: list[Node], labels: frozenset[str] or None = None) -> dict:
+    """
+    Extract all metadata from the rows of a publication page
+    :param rows: list of selectolax Node objects obtained in scrape_publication_page()
+    :param labels: if given, only the rows with these labels are kept
+    :return: dictionary of metadata
+    """
+    attributes = {}
+    for label, value in metadata_pairs(rows):
+        if labels is not None and label not in labels:
+            continue
+        if label in attributes:  # check if the label is already in the dictionary
+            attributes[label] = attributes[label] + ', ' + value  # extend the list
+        else:
+            attributes[label] = value
     return attributes
 
-def get_metrics(soup: BeautifulSoup) -> tuple[str, str]:
+def get_metrics(tree: HTMLParser) -> tuple[str, str]:
     """
     Get the number of views and downloads of a publication
-    :param soup: created from a publication page
+    :param tree: created from a publication page
     :return: number of views and downloads
     """
-    panel = soup.find('div', class_='panel-list-right')
+    panel = tree.css_first('div.panel-list-right')
     if not panel:
-        views = downloads = "Panel not found"
+        return "Panel not found", "Panel not found"
     # Get number of views
-    view_counter = panel.find('span', id='metric-counter-view')
+    view_counter = panel.css_first('span#metric-counter-view')
     if view_counter:
-        views = view_counter.text.strip()
+        views = view_counter.text().strip()
     else:
         views = "Views not found"
     # Get number of downloads
-    download_counter = panel.find('span', id='metric-counter-download')
+    download_counter = panel.css_first('span#metric-counter-download')
     if download_counter:
-        downloads = download_counter.text.strip()
+        downloads = download_counter.text().strip()
     else:
         downloads = "Downloads not found"
     return views, downloads
 
-def get_pdf_link(wrapper_display: Tag) -> str:
+def get_pdf_link(wrapper_display: Node) -> str:
     """
     Extract the link to the PDF of a publication from the wrapperDisplayItem in the page
-    :param wrapper_display: a bs4 Tag object obtained in scrape_publication_page()
+    :param wrapper_display: a selectolax Node object obtained in scrape_publication_page()
     :return: URL of the PDF
     """
-    link_div = wrapper_display.find('div', class_='item-bitstream-grid-bitstream-type')
-    if not link_div:
+    link = wrapper_display.css_first(PDF_LINK_SEL)
+    if not link:
         return "No bitstream grid found"
-    pdf_link = link_div.find('a')['href']
-    return pdf_link
+    return link.attributes['href']
+
+def scrape_publication_with_degree(id: int) -> dict or str:
+    """
+    Get all metadata from a publication page and the degree from the first page of its PDF
+    :param id: the id of the publication (the number at the end of the URL, after the last slash)
+    :return: dictionary of metadata including 'Degree', or error message
+    """
+    attributes = scrape_publication_page(id)
+    if not isinstance(attributes, dict):
+        return attributes
+    if not attributes['PDF link'].startswith('/'):  # no PDF, so no degree either
+        attributes['Degree'] = None
+        return attributes
+    # the PDF link from the publication page is used directly, so the page is not requested again
+    try:
+        with download_pdf(attributes['PDF link']) as pdf:
+            attributes['Degree'] = get_degree(parse_pdf(pdf))
+    except requests.RequestException as error:
+        status = error.response.status_code if error.response is not None else None
+        if status is not None and 400 <= status < 500 and status != 429:
+            # e.g. the PDF of an embargoed thesis, this won't change on a later run
+            attributes['Degree'] = f'PDF not available: {status}'
+        else:  # saved as an error so that the publication is retried on the next run
+            attributes['error'] = f'PDF download failed: {error!r}'
+    except (ValueError, IndexError, PyPdfError, pdfium.PdfiumError) as error:  # not a (readable) PDF
+        attributes['Degree'] = f'PDF could not be read: {error!r}'
+    return attributes
+
+def load_metadata(output: str) -> dict[int, dict]:
+    """
+    Read the publications saved in a JSON Lines file. An id can be on several lines if it was retried,
+    in which case the last line is the one that counts.
+    A last line cut off by an interrupted run is removed from the file.
+    :param output: path of the JSON Lines file written by collect_metadata()
+    :return: dictionary of the saved records by id, empty if the file doesn't exist yet
+    """
+    if not os.path.exists(output):
+        return {}
+    records = {}
+    with open(output, 'r+b') as file:
+        position = 0
+        for line in file:
+            if not line.endswith(b'\n'):  # the run was killed while writing this line
+                file.truncate(position)
+                break
+            position += len(line)
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            records[record['id']] = record
+    return records
+
+def saved_ids(output: str, degrees: bool = False) -> set[int]:
+    """
+    Get the ids of the publications already saved in a JSON Lines file.
+    Ids whose last record is a temporary error (e.g. 'Negative response: 503') are left out so that they are retried.
+    :param output: path of the JSON Lines file written by collect_metadata()
+    :param degrees: if True, publications saved without a degree are left out too
+    :return: set of ids, empty if the file doesn't exist yet
+    """
+    ids = set()
+    for id, record in load_metadata(output).items():
+        if 'error' in record:
+            if not record['error'].startswith(TEMPORARY_ERRORS):
+                ids.add(id)
+        elif not degrees or 'Degree' in record:
+            ids.add(id)
+    return ids
 
-def collect_metadata(ids: list[int]):
+def collect_metadata(ids: list[int],
+                     output: str = 'metadata.jsonl',
+                     workers: int = MAX_WORKERS,
+                     degrees: bool = False):
     """
-    Iterate through a list of ids and save the metadata of each publication to a json file
+    Scrape a list of ids concurrently and append the metadata of each publication to a JSON Lines file.
+    Ids which are already in the file are skipped, so an interrupted run can be resumed.
+    Retried ids get a new line, use load_metadata() to read the file with only the last line of each id.
     :param ids: list of ids (the number at the end of the URL, after the last slash)
+    :param output: path of the JSON Lines file, one publication per line
+    :param workers: number of publications scraped at the same time
+    :param degrees: if True, also download the PDF of each publication and save the degree found in it
     :return:
     """
-    for id in ids:
-        with open(f'metadata/{id}.json', 'w') as file:
-            json.dump(scrape_publication_page(id), file, indent=4)
+    scrape = scrape_publication_with_degree if degrees else scrape_publication_page
+    done = saved_ids(output, degrees)
+    ids = [id for id in ids if id not in done]
+    with open(output, 'ab') as file, ThreadPoolExecutor(max_workers=workers) as executor:
+        # ids are handed out in batches so that not all of them are queued at once,
+        # results come back in the order of ids and are written from this thread only
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            for id, data in zip(batch, executor.map(scrape, batch)):
+                if isinstance(data, str):  # error message instead of metadata
+                    data = {'error': data}
+                file.write(orjson.dumps({'id': id, **data}) + b'\n')
+                file.flush()  # so that a killed run loses at most the record being written
 
 if __name__ == '__main__':
     # test: try the first 100 pages